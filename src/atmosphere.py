@@ -1,6 +1,8 @@
 # File containing implementation of 1976 U.S. Standard Atmosphere
 
 import math
+import numpy as np
+from functools import lru_cache
 
 # Universal gas constant in N*km/(kmol*K)
 _R = .00831432
@@ -31,6 +33,10 @@ _REF_MOL_SCALE_TEMP = [288.15, 216.65, 216.65, 228.65, 270.65, 270.65, 214.65, 1
 # Standard Atmosphere paper. All pressures are in Pa
 _REF_PRESSURE = [101325, 22632.06, 5474.89, 868.02, 110.91, 66.94, 3.96]
 
+# Resolution in km that heights are rounded to before their density is looked up. Lets densities be precomputed
+# into a table since the simulation asks for a slightly different height every step
+_DENSITY_RESOLUTION = .1
+
 # Coefficients for a polynomial needed for solve for the density above 86 km.
 # Coefficients come from Robert Braeunig: www.braeunig.us/space/atmmodel.htm
 _DENSITY_COEFFICIENTS = [
@@ -49,17 +55,17 @@ _DENSITY_COEFFICIENTS = [
 # Raises exception when an input is out of bounds of the Standard Atmosphere height range
 def _checkInStandardAtmosphereRange(z):
 	if z < 0 or z > 1000:
-		raise Exception("Geometric height must be between 0 and 1000 km")
+		raise ValueError("Geometric height must be between 0 and 1000 km")
 
 # Raises exception when an input is not within the 0 to 86 km height range
 def _checkBelow86(z):
 	if z < 0 or z > 86:
-		raise Exception("Geometric height must be between 0 and 86 km")
+		raise ValueError("Geometric height must be between 0 and 86 km")
 
 # Raises exception when an input is not within the 86 (non-inclusive) to 1000 km range
 def _checkAbove86(z):
 	if z <= 86 or z > 1000:
-		raise Exception("Geometric height must be between 87 and 1000 km")
+		raise ValueError("Geometric height must be between 87 and 1000 km")
 
 # Converts the given geometric height in km to geopotential km'
 def _geometricToGeopotentialHeight(z):
@@ -189,16 +195,44 @@ def _getDensityAbove86(z):
 	# Get coefficients corresponding to this altitude range
 	a, b, c, d, e = _DENSITY_COEFFICIENTS[subscript]
 
-	# Return polynomial calculated with correct coefficients
-	return math.exp(a * z**4 + b * z**3 + c * z**2 + d * z + e) * 1000000000
+	# Return polynomial calculated with correct coefficients. Evaluated in Horner form to avoid the powers
+	return math.exp((((a * z + b) * z + c) * z + d) * z + e) * 1000000000
 
-# Returns density at given geometric height. Raises exception if z is not between 0 to 1000 km.
+# Returns density at given geometric height without any rounding. Raises exception if z is not between 0 to 1000 km.
 # Density unit it kg/km^3
-def getDensity(z):
+def _calculateDensity(z):
 	_checkInStandardAtmosphereRange(z)
 
 	# Check range and call appropriate function
 	if z <= 86:
 		return _getDensityBelow86(z)
 	else:
-		return _getDensityAbove86(z)
\ No newline at end of file
+		return _getDensityAbove86(z)
+
+# Returns density in kg/km^3 at every _DENSITY_RESOLUTION step from 0 to 1000 km. Stored as float32 since density
+# already spans many orders of magnitude and the rounding to _DENSITY_RESOLUTION is a far larger error. Built on the
+# first lookup rather than at import so importing this module stays cheap
+@lru_cache(maxsize = None)
+def _getDensityTable():
+	return np.array(
+		[_calculateDensity(step * _DENSITY_RESOLUTION) for step in range(round(1000 / _DENSITY_RESOLUTION) + 1)],
+		dtype = np.float32
+	)
+
+# Returns density at given geometric height, rounded to the nearest _DENSITY_RESOLUTION. Raises exception if z
+# is not between 0 to 1000 km. Density unit it kg/km^3
+def getDensity(z):
+	_checkInStandardAtmosphereRange(z)
+
+	# item() returns a Python float so callers keep doing double precision arithmetic
+	return _getDensityTable().item(round(z / _DENSITY_RESOLUTION))
+
+# Returns densities at an array of geometric heights, rounded to the nearest _DENSITY_RESOLUTION, in one vectorized
+# table lookup. Raises exception if any height is not between 0 to 1000 km. Density unit it kg/km^3
+def getDensities(z):
+	# Written so NaN heights fail the check too
+	if not np.all((z >= 0) & (z <= 1000)):
+		raise ValueError("Geometric height must be between 0 and 1000 km")
+
+	# Cast back up to float64 so callers keep doing double precision arithmetic
+	return _getDensityTable()[np.rint(z / _DENSITY_RESOLUTION).astype(np.intp)].astype(np.float64)
\ No newline at end of file
@@ -113,6 +113,7 @@ def main():
 	
 	averageArea = st.number_input("Average cross-sectional area (m²)", .0001, None, 1.00, help = "The average cross-sectional area of your spacecraft perpendicular to airflow")
 	timeStep = st.number_input("Time Step (s)", 1, 3600, 300, help = "The number of seconds skipped in simulation loop. Lower numbers are more accurate, but take much longer. Larger numbers are faster, but lead to less precise visualizations and predictions")
+	integrationMode = st.selectbox("Integration Mode", INTEGRATION_MODES, help = "Fixed Step uses the time step above for the entire decay. Orbit Averaged skips ahead one orbit at a time while perigee is above 150 km, which is much faster for long decays, then uses the time step above for reentry. The two agree to within 1% for time steps of 60 seconds or less")
 
 	"""
 	---
@@ -125,7 +126,7 @@ def main():
 
 	if st.button("Simulate"):
 		with st.spinner("Running Simulation..."):
-			totalElapsedSeconds, telemetry = simulateOrbitalDecay(apogee, perigee, inclination, mass, dragCoefficient, averageArea, timeStep)
+			totalElapsedSeconds, telemetry = simulateOrbitalDecay(apogee, perigee, inclination, mass, dragCoefficient, averageArea, timeStep, integrationMode)
 			
 			startDatetime = datetime.combine(startDate, startTime)
 
@@ -162,16 +163,16 @@ def main():
 
 				# Plot telemetry
 				"#### Apogee Over Time"
-				st.altair_chart(plotTelemetry(telemetry, "apogee", "Apogee (km)"), use_container_width = True)
+				st.vega_lite_chart(plotTelemetry(telemetry, "apogee", "Apogee (km)"), use_container_width = True)
 
 				"#### Perigee Over Time"
-				st.altair_chart(plotTelemetry(telemetry, "perigee", "Perigee (km)"), use_container_width = True)
+				st.vega_lite_chart(plotTelemetry(telemetry, "perigee", "Perigee (km)"), use_container_width = True)
 
 				"#### Velocity Over Time"
-				st.altair_chart(plotTelemetry(telemetry, "velocity", "Velocity (km/s)"), use_container_width = True)
+				st.vega_lite_chart(plotTelemetry(telemetry, "velocity", "Velocity (km/s)"), use_container_width = True)
 
 				"#### Acceleration Due to Drag Over Time"
-				st.altair_chart(plotTelemetry(telemetry, "dragAcceleration", "Acceleration Due to Drag m/s²"), use_container_width = True)
+				st.vega_lite_chart(plotTelemetry(telemetry, "dragAcceleration", "Acceleration Due to Drag m/s²"), use_container_width = True)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -1,5 +1,7 @@
 # File containing functions used for calculating orbital elements
+import math
 import numpy as np
+from functools import lru_cache
 import pandas as pd
 import streamlit as st
 from atmosphere import *
@@ -19,27 +21,60 @@ _OMEGA_EARTH = 0.00417806712
 # J2 constant for Earth
 J2 = 1.08262668e-3
 
-# Throws error if given apogee is < given perigee
+# Eccentricity below which the simulation treats an orbit as near-circular and uses the first-order
+# approximation of Kepler's first law
+_NEAR_CIRCULAR_ECCENTRICITY = 1e-3
+
+# Number of telemetry records the simulation allocates room for up front. Doubled whenever it runs out
+_INITIAL_TELEMETRY_CAPACITY = 4096
+
+# Ways the simulation can integrate the decay. Fixed Step advances by the user's time step for the whole
+# decay. Orbit Averaged advances a whole orbit at a time using the drag averaged over that orbit until
+# perigee drops below _ORBIT_AVERAGED_MIN_ALTITUDE, then finishes with fixed steps
+INTEGRATION_MODES = ["Fixed Step", "Orbit Averaged"]
+
+# Perigee altitude in km below which orbit-averaged integration hands off to fixed steps
+_ORBIT_AVERAGED_MIN_ALTITUDE = 150
+
+# Largest drop in semi-major axis in km that orbit-averaged integration takes in a single orbit
+_ORBIT_AVERAGED_MAX_DECAY = .2
+
+# Number of intervals used by Simpson's rule when averaging drag over half an orbit. Must be even
+_ORBIT_AVERAGE_INTERVALS = 64
+
+# Data type used to store recorded telemetry. The orbital state is integrated in double precision, but
+# telemetry is only ever plotted, so single precision is sufficient and halves its size
+_TELEMETRY_DTYPE = np.float32
+
+# Throws error if given apogee is < given perigee. Only called from entrypoints (the simulation driver
+# and calculateOrbitalPeriod, which plotting calls first) so the helpers used inside the simulation
+# loop don't pay for it on every step
 def _checkExtrema(a, p):
 	if a < p:
-		raise Exception("Apogee must be larger than or equal to perigee")
+		raise ValueError("Apogee must be larger than or equal to perigee")
+
+# Returns the mean motion in radians per second of an orbit with the given semi-major axis in km
+def calculateMeanMotion(semiMajorAxis):
+	return math.sqrt(MU / (semiMajorAxis * semiMajorAxis * semiMajorAxis))
 
-# Returns the orbital period in seconds given the apogee and perigee in km
+# Returns the orbital period in seconds given the apogee and perigee in km. Memoized since Streamlit reruns
+# call it with the same inputs over and over, so apogee and perigee must be scalars
+@lru_cache(maxsize = 1024)
 def calculateOrbitalPeriod(a, p):
 	_checkExtrema(a, p)
 
 	semiMajorAxis = calculateSemiMajorAxis(a, p)
 
-	return 2 * math.pi * math.sqrt(semiMajorAxis**3 / MU)
+	return 2 * math.pi / calculateMeanMotion(semiMajorAxis)
 
-# Returns semi-major axis in km from apogee and perigee in km
+# Returns semi-major axis in km from apogee and perigee in km. Memoized, so apogee and perigee must be scalars
+@lru_cache(maxsize = 1024)
 def calculateSemiMajorAxis(a, p):
-	_checkExtrema(a, p)
 	return ((a + RADIUS) + (p + RADIUS)) / 2
 
-# Returns eccentricity of orbit from apogee and perigee in km
+# Returns eccentricity of orbit from apogee and perigee in km. Memoized, so apogee and perigee must be scalars
+@lru_cache(maxsize = 1024)
 def calculateEccentricity(a, p):
-	_checkExtrema(a, p)
 	return ((a + RADIUS) - (p + RADIUS)) / (2 * calculateSemiMajorAxis(a, p))
 
 # Returns the angular velocity given an orbital velocity and distance from body
@@ -48,22 +83,33 @@ def calculateAngularVelocity(v, r):
 
 # Returns result of Kepler's first law given apogee, perigee, and the number of degrees from perigee
 def calculateMainFocusDistance(a, p, theta):
-	_checkExtrema(a, p)
-
 	# Calculate other elements needed
 	semiMajorAxis = calculateSemiMajorAxis(a, p)
 	eccentricity = calculateEccentricity(a, p)
 
-	# Calculate numerator and denominator separately of the equation represented by Kepler's first law
-	numerator = semiMajorAxis * (1 - eccentricity**2)
-	denominator = 1 + eccentricity * np.cos(np.radians(theta))
+	return calculateMainFocusDistanceFromSemiMajorAxis(semiMajorAxis, eccentricity, np.cos(np.radians(theta)))
 
-	return numerator / denominator
+# Returns result of Kepler's first law given semi-major axis, eccentricity, and the cosine of the angle from
+# perigee. Used by the simulation, which carries the semi-major axis and eccentricity as its state rather
+# than rederiving them from apogee and perigee every step. Takes the cosine so callers can compute it once
+def calculateMainFocusDistanceFromSemiMajorAxis(semiMajorAxis, eccentricity, cosTheta):
+	semiLatusRectum = semiMajorAxis * (1 - eccentricity * eccentricity)
+
+	return calculateMainFocusDistanceFromSemiLatusRectum(semiLatusRectum, eccentricity, cosTheta)
+
+# Returns result of Kepler's first law given the semi-latus rectum, eccentricity, and the cosine of the angle from
+# perigee. Lets the simulation, where eccentricity is constant, compute 1 - e^2 once instead of every step
+def calculateMainFocusDistanceFromSemiLatusRectum(semiLatusRectum, eccentricity, cosTheta):
+	return semiLatusRectum / (1 + eccentricity * cosTheta)
+
+# Returns the first-order approximation of Kepler's first law for near-circular orbits given semi-major axis,
+# eccentricity, and the cosine of the angle from perigee. Avoids the division in the full equation at the cost
+# of an error on the order of the eccentricity squared
+def calculateMainFocusDistanceNearCircular(semiMajorAxis, eccentricity, cosTheta):
+	return semiMajorAxis * (1 - eccentricity * cosTheta)
 
 # Calculates orbital velocity at a given angle theta from perigee given apogee and perigee
 def calculateOrbitalVelocity(a, p, theta):
-	_checkExtrema(a, p)
-
 	# Calculate other elements needed
 	semiMajorAxis = calculateSemiMajorAxis(a, p)
 	distance = calculateMainFocusDistance(a, p, theta)
@@ -72,50 +118,94 @@ def calculateOrbitalVelocity(a, p, theta):
 
 	return np.sqrt(MU * ratioDifference)
 
+# Calculates orbital velocity from the Vis-viva equation given the semi-major axis and the distance from
+# the body being orbited. Lets callers that already know the distance skip recomputing the trig in
+# calculateMainFocusDistance. Scalar only; uses math since NumPy's dispatch dominates for single floats
+def calculateVelocityFromSemiMajorAxis(semiMajorAxis, distance):
+	ratioDifference = (2 / distance) - (1 / semiMajorAxis)
+
+	return math.sqrt(MU * ratioDifference)
+
+# Calculates the orbital velocity of a circular orbit, which is the same everywhere on the orbit, given
+# the semi-major axis. Scalar only
+def calculateCircularVelocity(semiMajorAxis):
+	return math.sqrt(MU / semiMajorAxis)
+
 # Calculates the semi-major axis from the Vis-viva equation. Used to determine how the semi-major
 # axis of an orbit changes due to velocity changes caused by drag force. Takes the distance from
 # the body being orbited and the instantaneous orbital velocity
 def calculateSemiMajorAxisFromVisViva(r, v):
-	return -(MU * r) / (v**2 * r - 2 * MU)
+	return -(MU * r) / (v * v * r - 2 * MU)
 
 # Returns the acceleration experienced by the given mass at the given height with the given velocity,
 # drag coefficient, and reference area. Note that this uses Newton's second law F = ma and does
-# not take into account any effects of the velocity approaching the speed of light
-@st.cache(show_spinner = False)
+# not take into account any effects of the velocity approaching the speed of light. Deliberately not cached
+# with Streamlit since it is called with a new height and velocity every simulation step
 def calculateAccelerationFromDrag(m, z, v, cd, area):
 	# Check for non-zero mass
 	if m == 0:
-		raise Exception("Mass cannot be 0")
+		raise ValueError("Mass cannot be 0")
 
 	density = getDensity(z)
 
 	# Calculate drag force
-	dragForce = .5 * density * v**2 * cd * area
+	dragForce = .5 * density * v * v * cd * area
 
 	# Return acceleration
 	return dragForce / m
 
-# Main driver for orbital decay simulation. Takes initial apogee, perigee, inclination, drag coefficient, average
-# cross-sectional area in m^2, and the time step for the simulation.
-@st.cache(show_spinner = False)
-def simulateOrbitalDecay(a, p, i, m, cd, area, timeStep):
-	# Convert area to km^2
-	area *= 1e-6
+# Returns a copy of the given telemetry array with room for the given number of records
+def _growTelemetryRecord(record, capacity):
+	grown = np.empty(capacity, dtype = record.dtype)
+	grown[:record.size] = record
+
+	return grown
 
+# Integrates the decay of a single orbit until the spacecraft reenters. Takes initial apogee, perigee, mass, drag
+# coefficient, average cross-sectional area in km^2, and the time step. Returns the elapsed time in seconds and
+# a dict of telemetry arrays, or None if there were more than _MAX_POINTS records. Pure arithmetic with no Streamlit
+# or pandas dependencies
+def _simulateOrbitalDecayKernel(a, p, m, cd, area, timeStep):
 	# Initial parameters
-	theta = 0
+	theta = 0.0
 	time = 0
-	distance = calculateMainFocusDistance(a, p, theta)
-	altitude = distance - RADIUS
-	eccentricity = calculateEccentricity(a, p)
+	steps = 0
 	semiMajorAxis = calculateSemiMajorAxis(a, p)
+	eccentricity = calculateEccentricity(a, p)
 
-	telemetry = {"time" : [], "dragAcceleration" : [], "velocity" : [], "apogee" : [], "perigee" : []}
+	# Eccentricity is held constant, so the geometry used for the orbit only needs to be chosen once
+	isCircular = eccentricity == 0
+	isNearCircular = eccentricity < _NEAR_CIRCULAR_ECCENTRICITY
+
+	# Eccentricity is constant, so the part of the semi-latus rectum that depends on it is too
+	oneMinusEccentricitySquared = 1 - eccentricity * eccentricity
+
+	# Telemetry is written into preallocated arrays instead of being appended to lists every step. The arrays
+	# start small and double as needed. Nothing is stored past _MAX_POINTS records since that much telemetry
+	# would slow down the browser and isn't plotted
+	capacity = _INITIAL_TELEMETRY_CAPACITY
+	timeRecord = np.empty(capacity)
+	dragAccelerationRecord = np.empty(capacity, dtype = _TELEMETRY_DTYPE)
+	velocityRecord = np.empty(capacity, dtype = _TELEMETRY_DTYPE)
+	apogeeRecord = np.empty(capacity, dtype = _TELEMETRY_DTYPE)
+	perigeeRecord = np.empty(capacity, dtype = _TELEMETRY_DTYPE)
 
 	# Main simulation loop
-	while altitude >= 0:
-		distance = calculateMainFocusDistance(a, p, theta)
-		velocity = calculateOrbitalVelocity(a, p, theta)
+	while True:
+		if isCircular:
+			# Distance and velocity are the same everywhere on a circular orbit, so no trig is needed
+			distance = semiMajorAxis
+			velocity = calculateCircularVelocity(semiMajorAxis)
+		else:
+			# theta is a scalar in radians here, so use math rather than NumPy's array machinery
+			cosTheta = math.cos(theta)
+
+			if isNearCircular:
+				distance = calculateMainFocusDistanceNearCircular(semiMajorAxis, eccentricity, cosTheta)
+			else:
+				distance = calculateMainFocusDistanceFromSemiLatusRectum(semiMajorAxis * oneMinusEccentricitySquared, eccentricity, cosTheta)
+
+			velocity = calculateVelocityFromSemiMajorAxis(semiMajorAxis, distance)
 		altitude = distance - RADIUS
 
 		if altitude <= 0 or altitude > 1000:
@@ -128,37 +218,136 @@ def simulateOrbitalDecay(a, p, i, m, cd, area, timeStep):
 		theta +=  timeStep * calculateAngularVelocity(velocity, distance)
 		semiMajorAxis = calculateSemiMajorAxisFromVisViva(distance, velocity)
 		
-		# Recalculate apogee and perigee for next iteration
+		# Apogee and perigee are only derived from the semi-major axis for telemetry and the bounds check
 		a = semiMajorAxis * (1 + eccentricity) - RADIUS
 		p = semiMajorAxis * (1 - eccentricity) - RADIUS
 
 		if a <= 0 or p <= 0 or a < p:
 			break
 
+		if steps == capacity and capacity < _MAX_POINTS:
+			capacity = min(2 * capacity, _MAX_POINTS)
+			timeRecord = _growTelemetryRecord(timeRecord, capacity)
+			dragAccelerationRecord = _growTelemetryRecord(dragAccelerationRecord, capacity)
+			velocityRecord = _growTelemetryRecord(velocityRecord, capacity)
+			apogeeRecord = _growTelemetryRecord(apogeeRecord, capacity)
+			perigeeRecord = _growTelemetryRecord(perigeeRecord, capacity)
+
+		if steps < capacity:
+			timeRecord[steps] = time
+			dragAccelerationRecord[steps] = dragAcceleration
+			velocityRecord[steps] = velocity
+			apogeeRecord[steps] = a
+			perigeeRecord[steps] = p
+
+		steps += 1
+		time += timeStep
+
+	if steps > _MAX_POINTS:
+		return (time, None)
+
+	telemetry = {
+		"time" : timeRecord[:steps],
+		"dragAcceleration" : dragAccelerationRecord[:steps],
+		"velocity" : velocityRecord[:steps],
+		"apogee" : apogeeRecord[:steps],
+		"perigee" : perigeeRecord[:steps]
+	}
+
+	return (time, telemetry)
+
+# Integrates the decay of a single orbit one whole orbit at a time until perigee drops below
+# _ORBIT_AVERAGED_MIN_ALTITUDE or drag becomes too strong to average, then hands off to
+# _simulateOrbitalDecayKernel for reentry. Each orbit, the drag is averaged over the orbit with Simpson's rule
+# and the semi-major axis is updated from the energy it removes. Takes and returns the same values as
+# _simulateOrbitalDecayKernel
+def _simulateOrbitAveragedDecayKernel(a, p, m, cd, area, timeStep):
+	time = 0
+	semiMajorAxis = calculateSemiMajorAxis(a, p)
+	eccentricity = calculateEccentricity(a, p)
+
+	# True anomalies averaged over. The orbit is symmetric about the line of apsides, so only half of it is
+	# sampled and every integral is doubled
+	cosTheta = np.cos(np.linspace(0, math.pi, _ORBIT_AVERAGE_INTERVALS + 1))
+	oneMinusEccentricitySquared = 1 - eccentricity * eccentricity
+
+	# Simpson's rule weights for the samples above
+	weights = np.ones(_ORBIT_AVERAGE_INTERVALS + 1)
+	weights[1:-1:2] = 4
+	weights[2:-1:2] = 2
+	weights *= math.pi / (3 * _ORBIT_AVERAGE_INTERVALS)
+
+	# There are far fewer orbits than fixed steps, so these records are simply appended to
+	telemetry = {"time" : [], "dragAcceleration" : [], "velocity" : [], "apogee" : [], "perigee" : []}
+
+	while p >= _ORBIT_AVERAGED_MIN_ALTITUDE and a <= 1000:
+		period = 2 * math.pi / calculateMeanMotion(semiMajorAxis)
+
+		semiLatusRectum = semiMajorAxis * oneMinusEccentricitySquared
+		distance = calculateMainFocusDistanceFromSemiLatusRectum(semiLatusRectum, eccentricity, cosTheta)
+		velocity = np.sqrt(MU * ((2 / distance) - (1 / semiMajorAxis)))
+
+		# An apogee right at the top of the atmosphere model can come out a rounding error above it
+		density = getDensities(np.minimum(distance - RADIUS, 1000))
+		dragAcceleration = .5 * density * velocity * velocity * cd * area / m
+
+		# Time spent per radian of true anomaly at each sample, from conservation of angular momentum
+		timePerRadian = distance * distance / math.sqrt(MU * semiLatusRectum)
+
+		# Rate of energy loss to drag is v * a_drag, and E = -MU / (2 * semi-major axis), so the semi-major axis
+		# shrinks by 2 * semi-major axis^2 / MU times the energy lost over the orbit
+		energyLost = 2 * np.dot(weights, velocity * dragAcceleration * timePerRadian)
+		decayedSemiMajorAxis = semiMajorAxis - 2 * semiMajorAxis * semiMajorAxis * energyLost / MU
+
+		# Hand off to fixed steps from the current state if this orbit would take perigee below
+		# _ORBIT_AVERAGED_MIN_ALTITUDE or lower the semi-major axis by more than _ORBIT_AVERAGED_MAX_DECAY. Drag that
+		# strong isn't constant over an orbit, and a single averaged update can even overshoot to an invalid orbit
+		if decayedSemiMajorAxis * (1 - eccentricity) - RADIUS < _ORBIT_AVERAGED_MIN_ALTITUDE or semiMajorAxis - decayedSemiMajorAxis > _ORBIT_AVERAGED_MAX_DECAY:
+			break
+
+		semiMajorAxis = decayedSemiMajorAxis
+		a = semiMajorAxis * (1 + eccentricity) - RADIUS
+		p = semiMajorAxis * (1 - eccentricity) - RADIUS
+
 		telemetry["time"].append(time)
-		telemetry["dragAcceleration"].append(dragAcceleration)
-		telemetry["velocity"].append(velocity)
+		telemetry["dragAcceleration"].append(2 * np.dot(weights, dragAcceleration * timePerRadian) / period)
+		telemetry["velocity"].append(2 * np.dot(weights, velocity * timePerRadian) / period)
 		telemetry["apogee"].append(a)
 		telemetry["perigee"].append(p)
 
-		time += timeStep
+		time += period
+
+	# Finish the decay with fixed steps once drag changes too much over an orbit to be averaged
+	remainingTime, remainingTelemetry = _simulateOrbitalDecayKernel(a, p, m, cd, area, timeStep)
+
+	if remainingTelemetry is None or len(telemetry["time"]) + len(remainingTelemetry["time"]) > _MAX_POINTS:
+		return (time + remainingTime, None)
+
+	remainingTelemetry["time"] += time
+	telemetry = {
+		column : np.concatenate((np.asarray(telemetry[column], dtype = remainingTelemetry[column].dtype), remainingTelemetry[column]))
+		for column in telemetry
+	}
+
+	return (time + remainingTime, telemetry)
+
+# Main driver for orbital decay simulation. Takes initial apogee, perigee, inclination, drag coefficient, average
+# cross-sectional area in m^2, the time step for the simulation, and one of INTEGRATION_MODES. Streamlit caching
+# is only applied here so the kernels themselves stay free of hashing overhead. Output mutation is allowed so
+# Streamlit doesn't rehash the whole telemetry DataFrame on every cache hit; callers only read it
+@st.cache(show_spinner = False, allow_output_mutation = True)
+def simulateOrbitalDecay(a, p, i, m, cd, area, timeStep, mode = INTEGRATION_MODES[0]):
+	_checkExtrema(a, p)
+
+	if mode not in INTEGRATION_MODES:
+		raise ValueError("Integration mode must be one of " + ", ".join(INTEGRATION_MODES))
+
+	kernel = _simulateOrbitAveragedDecayKernel if mode == "Orbit Averaged" else _simulateOrbitalDecayKernel
+
+	# Convert area to km^2
+	time, telemetry = kernel(a, p, m, cd, area * 1e-6, timeStep)
+
+	# Telemetry is None if there was too much data to plot
+	telemetryDataFrame = None if telemetry is None else pd.DataFrame(telemetry)
 
-	# Make sure apogee and perigee aren't negative
-	if a < 0:
-		a = 0
-	if p < 0:
-		p = 0
-
-	# Try to create dataframe from telemetry if there is not too much data
-	telemetryDataFrame = None
-
-	try:
-		telemetryDataFrame = pd.DataFrame(telemetry)
-	
-		# Even if dataframe is within size limits, too many records could slow down browser
-		if len(telemetryDataFrame) > _MAX_POINTS:
-			telemetryDataFrame = None
-	except:
-		pass
-	
 	return (time, telemetryDataFrame)
\ No newline at end of file
@@ -2,14 +2,6 @@
 from orbital_mechanics import *
 import plotly.graph_objects as go
 import streamlit as st
-import altair as alt
-from poliastro.earth.plotting import GroundtrackPlotter
-from poliastro.earth import EarthSatellite
-from poliastro.twobody import Orbit
-from poliastro.bodies import Earth
-from astropy import units as u
-from poliastro.util import time_range
-import plotly.graph_objects as go
 
 # Color of ground track points
 _TRACK_COLOR = "darkblue"
@@ -19,9 +11,45 @@ _LAND_COLOR = "white"
 _WATER_COLOR = "rgb(140, 181, 245)"
 _COUNTRY_COLOR = "lightgray"
 
+# Number of ground track samples per orbit
+_TRACK_POINTS_PER_ORBIT = 75
+
+# Convergence tolerance in radians and iteration cap when solving Kepler's equation for ground track samples
+_KEPLER_TOLERANCE = 1e-12
+_KEPLER_MAX_ITERATIONS = 50
+
 # Color of launch site marker
 _LAUNCH_SITE_COLOR = "crimson"
 
+# Fully transparent color used for figure backgrounds
+_TRANSPARENT = "rgba(0, 0, 0, 0)"
+
+# Figure margins that let the map fill its container
+_MARGIN_ZERO = {"l" : 0, "r" : 0, "b" : 0, "t" : 0}
+
+# Maximum number of points drawn in a telemetry chart. Longer telemetry is downsampled
+_MAX_CHART_POINTS = 2000
+
+# Map styling shared by every ground track, built once instead of on every call. The projection type is set per call
+_GEO_LAYOUT = {
+	"bgcolor" : _TRANSPARENT,
+	"showframe" : False,
+	"showcoastlines" : True,
+	"coastlinecolor" : "black",
+	"showland" : True,
+	"showocean" : True,
+	"lataxis" : {"showgrid" : False},
+	"lonaxis" : {"showgrid" : False},
+	"showlakes" : True,
+	"showcountries" : True,
+	"showrivers" : True,
+	"oceancolor" : _WATER_COLOR,
+	"landcolor" : _LAND_COLOR,
+	"lakecolor" : _WATER_COLOR,
+	"rivercolor" : _WATER_COLOR,
+	"countrycolor" : _COUNTRY_COLOR
+}
+
 # Plotly projection types
 PROJECTION_TYPES = [
 	"Equirectangular",
@@ -47,88 +75,177 @@ PROJECTION_TYPES = [
 	"Sinusoidal"
 ]
 
-# Returns Plotly figure of scatter mapbox plot of the ground track of an orbit given: apogee, perigee,
-# inclination, right ascension of the ascending node, argument of perigee, true anomaly, starting lat,
-# and starting lon
-@st.cache(show_spinner = False)
-def plotGroundTrack(a, p, i, raan, argOfPerigee, trueAnomaly, startingLat, startingLon, proj = PROJECTION_TYPES[0], showMany = False):
-	fig = GroundtrackPlotter()
+# Returns the latitudes and longitudes in degrees of the ground track of an orbit given: apogee, perigee, inclination,
+# right ascension of the ascending node, argument of perigee, and true anomaly. Only the propagation is cached, so
+# changing the map projection or launch site doesn't re-propagate the orbit. Output mutation is allowed so Streamlit
+# doesn't rehash the returned arrays on every cache hit; callers must not modify them
+@st.cache(show_spinner = False, allow_output_mutation = True)
+def _calculateGroundTrack(a, p, i, raan, argOfPerigee, trueAnomaly, showMany):
+	# poliastro and astropy take a long time to import, so they are only imported once a ground track is needed
+	from poliastro.core.elements import coe2rv_many
+	from poliastro.core.angles import E_to_M, nu_to_E
+	from poliastro.constants import J2000
+	from astropy import units as u
+	from astropy.coordinates import GCRS, ITRS, CartesianRepresentation
 
 	# Derive orbital elements needed to plot ground track
 	period = calculateOrbitalPeriod(a, p)
 	semiMajoraxis = calculateSemiMajorAxis(a, p)
 	eccentricity = calculateEccentricity(a, p)
 
-	# Multiply period if many orbit tracks are to be shown
+	# Track spans one period either side of epoch. Multiply period if many orbit tracks are to be shown, scaling the
+	# number of samples so every orbit is drawn at the same resolution
+	samples = _TRACK_POINTS_PER_ORBIT * 2
 	if showMany:
+		samples = math.ceil(_TRACK_POINTS_PER_ORBIT * 86400 / period)
 		period *= 86400 / period / 2
 
-	# Create objection needed for poliastro GroundPlotter
-	orbit = Orbit.from_classical(Earth, semiMajoraxis * u.km, eccentricity * u.one, i * u.deg, raan * u.deg, argOfPerigee * u.deg, trueAnomaly * u.deg)
-	sat = EarthSatellite(orbit, None)
-	t_span = time_range(orbit.epoch - period * u.s, periods = 150, end = orbit.epoch + period * u.s)
-	
-	# Plot ground track
-	fig.plot(
-		sat,
-		t_span,
-		label = "Ground Track",
-		color = _TRACK_COLOR,
-		marker={"size": 0, "symbol": "triangle-right"},
-	)
+	# Propagate orbit with poliastro's unitless core functions rather than through an Orbit object, which wraps every
+	# step in astropy quantities. Epoch is J2000, the default epoch for poliastro orbits
+	semiLatusRectum = semiMajoraxis * (1 - eccentricity * eccentricity)
+	inc, ascendingNode, argp, nu = np.radians([i, raan, argOfPerigee, trueAnomaly])
+	offsets = np.linspace(-period, period, samples)
 
-	# Format map
-	fig.fig.update_geos(
-		bgcolor = "rgba(0, 0, 0, 0)",
-		showframe = False,
-		lataxis = {"showgrid" : False},
-		lonaxis = {"showgrid" : False},
-		showlakes = True,
-		showcountries = True,
-		showrivers = True,
-		oceancolor = _WATER_COLOR,
-		landcolor = _LAND_COLOR,
-		lakecolor = _WATER_COLOR,
-		rivercolor = _WATER_COLOR,
-		countrycolor = _COUNTRY_COLOR,
-		projection_type = proj.lower()
-	)
+	# Mean anomaly advances linearly with time, so every sample's eccentric anomaly is solved from Kepler's equation at
+	# once with Newton's method on whole arrays. Orbits here are nearly circular, so this converges in a few iterations
+	meanAnomalies = E_to_M(nu_to_E(nu, eccentricity), eccentricity) + calculateMeanMotion(semiMajoraxis) * offsets
+	eccentricAnomalies = meanAnomalies.copy()
+	for _ in range(_KEPLER_MAX_ITERATIONS):
+		correction = (eccentricAnomalies - eccentricity * np.sin(eccentricAnomalies) - meanAnomalies) / (1 - eccentricity * np.cos(eccentricAnomalies))
+		eccentricAnomalies -= correction
+		if np.abs(correction).max() < _KEPLER_TOLERANCE:
+			break
 
-	fig.fig.update_traces(
-		marker = {"color" : "rgba(0, 0, 0, 0)"},
-	)
+	trueAnomalies = 2 * np.arctan2(math.sqrt(1 + eccentricity) * np.sin(eccentricAnomalies / 2), math.sqrt(1 - eccentricity) * np.cos(eccentricAnomalies / 2))
 
-	fig.fig.update_layout(
-		showlegend = False,
-		margin = {"l" : 0, "r" : 0, "b" : 0, "t" : 0}
-	)
+	# Convert every sample to a position in one call. coe2rv_many takes each element as an array, one entry per sample
+	elements = [np.full(samples, element, dtype = np.float64) for element in (MU, semiLatusRectum, eccentricity, inc, ascendingNode, argp)]
+	positions, _ = coe2rv_many(*elements, trueAnomalies)
 
-	# Add launch site point
-	fig.add_trace(
-		go.Scattergeo(
-			lat = [startingLat],
-			lon = [startingLon],
-			name = "Launch Site 🚀",
-			marker = {"color" : _LAUNCH_SITE_COLOR}
-		)
-	)
+	# Transform positions into the Earth-fixed frame to get the latitude and longitude under the spacecraft
+	t_span = J2000 + offsets * u.s
+	inertial = CartesianRepresentation(positions.T * u.km)
+	earthFixed = GCRS(inertial, obstime = t_span, representation_type = CartesianRepresentation).transform_to(ITRS(obstime = t_span))
+	x, y, z = earthFixed.cartesian.xyz.to_value(u.km)
+
+	# Convert Earth-fixed positions to geocentric latitude and longitude
+	lat = np.degrees(np.arcsin(z / np.sqrt(x * x + y * y + z * z))).astype(np.float32)
+	lon = np.degrees(np.arctan2(y, x)).astype(np.float32)
+
+	return (lat, lon)
 
-	return fig.fig
+# Returns Plotly figure of scatter mapbox plot of the ground track of an orbit given: apogee, perigee,
+# inclination, right ascension of the ascending node, argument of perigee, true anomaly, starting lat,
+# and starting lon
+def plotGroundTrack(a, p, i, raan, argOfPerigee, trueAnomaly, startingLat, startingLon, proj = PROJECTION_TYPES[0], showMany = False):
+	lat, lon = _calculateGroundTrack(a, p, i, raan, argOfPerigee, trueAnomaly, showMany)
+
+	return go.Figure(
+		data = [
+			go.Scattergeo(
+				lat = lat,
+				lon = lon,
+				mode = "lines",
+				name = "Ground Track",
+				line = {"color" : _TRACK_COLOR},
+
+				# Hover labels are set once per trace and round coordinates, since the track is stored as float32
+				hovertemplate = "%{lat:.2f}°, %{lon:.2f}°<extra>Ground Track</extra>"
+			),
+
+			# Launch site point
+			go.Scattergeo(
+				lat = [startingLat],
+				lon = [startingLon],
+				name = "Launch Site 🚀",
+				marker = {"color" : _LAUNCH_SITE_COLOR},
+				hovertemplate = "%{lat:.2f}°, %{lon:.2f}°<extra>Launch Site 🚀</extra>"
+			)
+		],
+		layout = {
+			"geo" : dict(_GEO_LAYOUT, projection_type = proj.lower()),
+			"showlegend" : False,
+			"margin" : _MARGIN_ZERO
+		}
+	)
 
-# Returns Altair chart visualizing telemetry data. Takes telemetry dataframe, name of column to visualize over time, and the
-# Y-axis label for the plot
+# Returns indices of the points to keep when downsampling x and y to the given number of points using the
+# Largest-Triangle-Three-Buckets algorithm, which preserves the visual shape of a line. The first and last points are
+# always kept
+def _lttb(x, y, points):
+	size = len(x)
+	if points >= size or points < 3:
+		return np.arange(size)
+
+	# Split every point but the first and last into buckets, one point of which is kept per bucket
+	edges = np.linspace(1, size - 1, points - 1).astype(int)
+	indices = np.empty(points, dtype = int)
+	indices[0] = 0
+	indices[-1] = size - 1
+
+	previous = 0
+	for bucket in range(points - 2):
+		start = edges[bucket]
+		end = edges[bucket + 1]
+
+		# The third triangle vertex is the average of the next bucket, or the last point for the final bucket
+		if bucket + 2 < len(edges):
+			nextX = x[end:edges[bucket + 2]].mean()
+			nextY = y[end:edges[bucket + 2]].mean()
+		else:
+			nextX = x[-1]
+			nextY = y[-1]
+
+		# Keep the point forming the largest triangle with the previously kept point and the next bucket's average
+		area = np.abs((x[previous] - nextX) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (nextY - y[previous]))
+		previous = start + int(area.argmax())
+		indices[bucket + 1] = previous
+
+	return indices
+
+# Returns Vega-Lite chart spec visualizing telemetry data, with the data embedded, for st.vega_lite_chart. The spec
+# is written out directly rather than built with Altair, which validates every property against the Vega-Lite schema
+# on each call. Takes telemetry dataframe, name of column to visualize over time, and the Y-axis label for the plot
 def plotTelemetry(telemetry, column, label):
-	# Get smallest and largest datapoints for scaling
-	smallestY = telemetry[column].min()
-	largestY = telemetry[column].max()
-
-	smallestX = telemetry["time"].min()
-	largestX = telemetry["time"].max()
-
-	return alt.Chart(telemetry).mark_line().encode(
-		x = alt.X("time", axis = alt.Axis(title = "Time (s)"), scale = alt.Scale(domain = (smallestX, largestX))),
-		y = alt.Y(column, axis = alt.Axis(title = label), scale = alt.Scale(domain = (smallestY, largestY))),
-		tooltip = ["time", column]
-	).add_selection(
-		alt.selection_interval(bind = "scales")
-	)
\ No newline at end of file
+	# Nothing to scale or downsample without any records, so return a chart with just its axes
+	if len(telemetry) == 0:
+		return {
+			"data" : telemetry[["time", column]],
+			"mark" : "line",
+			"encoding" : {
+				"x" : {"field" : "time", "type" : "quantitative", "axis" : {"title" : "Time (s)"}},
+				"y" : {"field" : column, "type" : "quantitative", "axis" : {"title" : label}}
+			}
+		}
+
+	times = telemetry["time"].to_numpy(np.float64)
+	values = telemetry[column].to_numpy(np.float64)
+
+	# Get smallest and largest datapoints for scaling. Cast to Python floats since NumPy scalars are not JSON
+	# serializable. Time only ever increases, so its extremes are the first and last values
+	smallestY = float(values.min())
+	largestY = float(values.max())
+
+	smallestX = float(times[0])
+	largestX = float(times[-1])
+
+	# Downsample long telemetry so the browser isn't asked to draw tens of thousands of points
+	if len(telemetry) > _MAX_CHART_POINTS:
+		indices = _lttb(times, values, _MAX_CHART_POINTS)
+		telemetry = telemetry.iloc[indices]
+
+	return {
+		"data" : telemetry[["time", column]],
+		"mark" : "line",
+		"encoding" : {
+			"x" : {"field" : "time", "type" : "quantitative", "axis" : {"title" : "Time (s)"}, "scale" : {"domain" : [smallestX, largestX]}},
+			"y" : {"field" : column, "type" : "quantitative", "axis" : {"title" : label}, "scale" : {"domain" : [smallestY, largestY]}},
+			"tooltip" : [
+				{"field" : "time", "type" : "quantitative"},
+				{"field" : column, "type" : "quantitative"}
+			]
+		},
+		"selection" : {
+			"zoom" : {"type" : "interval", "bind" : "scales"}
+		}
+	}
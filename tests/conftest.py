@@ -0,0 +1,5 @@
+# Lets tests import the app's modules the same way they import each other, as top-level modules from src
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
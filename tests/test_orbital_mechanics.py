@@ -0,0 +1,41 @@
+# Tests for the orbital decay simulation. The kernels are tested directly so the results don't depend on Streamlit's
+# cache
+import numpy as np
+import pytest
+from orbital_mechanics import *
+from orbital_mechanics import _simulateOrbitalDecayKernel, _simulateOrbitAveragedDecayKernel
+
+# An eccentric orbit must swing out to apogee, and slow down to apogee speed, within its first orbit
+@pytest.mark.parametrize("a, p", [(500, 150), (600, 200)])
+def test_fixed_step_reaches_apogee_within_one_orbit(a, p):
+	time, telemetry = _simulateOrbitalDecayKernel(a, p, 100, 2.2, 1e-6, 10)
+	firstOrbit = telemetry["time"] < calculateOrbitalPeriod(a, p)
+	apogeeVelocity = calculateVelocityFromSemiMajorAxis(calculateSemiMajorAxis(a, p), RADIUS + a)
+
+	assert telemetry["velocity"][firstOrbit].min() == pytest.approx(apogeeVelocity, rel = 1e-3)
+
+# Apogees right at the top of the atmosphere model must not be rejected when drag is sampled around the orbit
+@pytest.mark.parametrize("p", [150, 164, 180, 200])
+def test_orbit_averaged_apogee_at_model_limit(p):
+	time, telemetry = _simulateOrbitAveragedDecayKernel(1000, p, 1000, 1.15, 1e-6, 300)
+
+	assert time > 0
+
+# Drag strong enough to take perigee below the handoff altitude in one orbit must hand off to fixed steps from a
+# valid orbit instead of overshooting
+@pytest.mark.parametrize("a, p", [(150, 150), (200, 200), (300, 200), (400, 160)])
+def test_orbit_averaged_high_drag_hands_off(a, p):
+	time, telemetry = _simulateOrbitAveragedDecayKernel(a, p, 1, 2.2, 10e-6, 10)
+
+	assert time > 0
+	assert telemetry["perigee"].min() > 0
+
+# Orbit-averaged landing estimates must match fixed steps on decays that spend a good share of their orbits being
+# averaged. Decays are kept to a few weeks so the fixed step runs are quick
+@pytest.mark.parametrize("a, p, m", [(300, 300, 100), (400, 400, 10), (450, 400, 10), (500, 300, 30)])
+def test_integration_modes_agree(a, p, m):
+	fixedTime, fixedTelemetry = _simulateOrbitalDecayKernel(a, p, m, 2.2, 1e-6, 60)
+	averagedTime, averagedTelemetry = _simulateOrbitAveragedDecayKernel(a, p, m, 2.2, 1e-6, 60)
+
+	assert (np.diff(averagedTelemetry["time"]) > 60).sum() >= 30
+	assert averagedTime == pytest.approx(fixedTime, rel = .005)
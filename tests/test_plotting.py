@@ -0,0 +1,34 @@
+# Tests for the plots
+import pandas as pd
+import pytest
+
+pytest.importorskip("plotly")
+from plotting import plotTelemetry
+
+# Ground track latitudes never exceed the inclination, for any true anomaly the slider allows
+@pytest.mark.parametrize("trueAnomaly", [0, 90, 180, 270, 360])
+def test_ground_track_within_inclination(trueAnomaly):
+	pytest.importorskip("poliastro")
+	from plotting import _calculateGroundTrack
+
+	lat, lon = _calculateGroundTrack(800, 200, 51.6, 0, 0, trueAnomaly, False)
+
+	assert len(lat) == len(lon) == 150
+	assert abs(lat).max() <= 51.6 + .1
+
+# Telemetry with no records must still produce a chart instead of failing to find its extremes
+def test_plot_telemetry_empty():
+	telemetry = pd.DataFrame({"time" : [], "velocity" : []})
+	spec = plotTelemetry(telemetry, "velocity", "Velocity (km/s)")
+
+	assert len(spec["data"]) == 0
+	assert "domain" not in spec["encoding"]["x"]
+	assert "domain" not in spec["encoding"]["y"]
+
+# Telemetry with records is scaled to its own extremes
+def test_plot_telemetry_domains():
+	telemetry = pd.DataFrame({"time" : [0.0, 60.0, 120.0], "velocity" : [7.8, 7.7, 7.9]})
+	spec = plotTelemetry(telemetry, "velocity", "Velocity (km/s)")
+
+	assert spec["encoding"]["x"]["scale"]["domain"] == [0.0, 120.0]
+	assert spec["encoding"]["y"]["scale"]["domain"] == pytest.approx([7.7, 7.9])